@@ -22,27 +22,39 @@ Must be tested with Python 2 and Python 3.
 
 from __future__ import print_function
 
+import functools
 import hashlib
 import os
-import platform
+import shutil
 import subprocess
 import sys
+import zlib
 
+# Try the Python 3 names first so the common case doesn't pay for a failed
+# import search. The Python 2 names are still needed because env_setup.py,
+# which imports this module, is run with whatever Python is on the path.
 try:
-    import httplib
+    import http.client as httplib
 except ImportError:
-    import http.client as httplib  # type: ignore
+    import httplib  # type: ignore  # Python 2.
 
 try:
-    import urlparse  # Python 2.
+    import urllib.parse as urlparse
 except ImportError:
-    import urllib.parse as urlparse  # type: ignore
+    import urlparse  # type: ignore  # Python 2.
 
 SCRIPT_DIR = os.path.dirname(__file__)
 VERSION_FILE = os.path.join(SCRIPT_DIR, '.cipd_version')
 DIGESTS_FILE = VERSION_FILE + '.digests'
 # Put CIPD client in tools so that users can easily get it in their PATH.
 CIPD_HOST = 'chrome-infra-packages.appspot.com'
+# Read files in blocks when hashing so the whole client isn't held in memory.
+HASH_BLOCK_SIZE = 1 << 20
+# The client compresses well, so ask for it gzipped if the server can do that.
+REQUEST_HEADERS = {
+    'Accept-Encoding': 'gzip',
+    'Connection': 'keep-alive',
+}
 
 try:
     PW_ROOT = os.environ['PW_ROOT']
@@ -66,42 +78,93 @@ else:
     DEFAULT_INSTALL_DIR = ''
 
 
-def platform_normalized():
-    """Normalize platform into format expected in CIPD paths."""
+def _cache_result(func):
+    """Caches the result of a function that takes no arguments.
 
-    try:
-        os_name = platform.system().lower()
-        return {
-            'linux': 'linux',
-            'mac': 'mac',
-            'darwin': 'mac',
-            'windows': 'windows',
-        }[os_name]
-    except KeyError:
-        raise Exception('unrecognized os: {}'.format(os_name))
+    functools.lru_cache isn't available in Python 2.
+    """
 
+    result = []
 
-def arch_normalized():
-    """Normalize arch into format expected in CIPD paths."""
+    @functools.wraps(func)
+    def wrapper():
+        if not result:
+            result.append(func())
+        return result[0]
+
+    return wrapper
+
+
+def _platform():
+    """Returns the platform as named in CIPD paths, or None if unknown."""
+
+    # sys.platform is 'linux2' in Python 2 and 'linux' in Python 3.
+    if sys.platform.startswith('linux'):
+        return 'linux'
+    if sys.platform == 'darwin':
+        return 'mac'
+    if sys.platform == 'win32':
+        return 'windows'
+    return None
+
+
+def _machine():
+    """Returns the same value as platform.machine(), without the overhead."""
+
+    if os.name == 'nt':
+        return (os.environ.get('PROCESSOR_ARCHITEW6432')
+                or os.environ.get('PROCESSOR_ARCHITECTURE', ''))
+    # os.uname() returns a plain tuple in Python 2.
+    return os.uname()[4]
 
-    machine = platform.machine()
+
+def _arch():
+    """Returns the arch as named in CIPD paths, or None if unknown."""
+
+    machine = _machine()
     if machine.startswith('arm'):
         return machine
     if machine.endswith('64'):
         return 'amd64'
     if machine.endswith('86'):
         return '386'
-    raise Exception('unrecognized arch: {}'.format(machine))
+    return None
+
+
+# Neither can change while running, so work them out once. Unrecognized
+# values only raise when used, so importing this module always succeeds.
+PLATFORM = _platform()
+ARCH = _arch()
+
+
+def platform_normalized():
+    """Normalize platform into format expected in CIPD paths."""
+
+    if PLATFORM is None:
+        raise Exception('unrecognized os: {}'.format(sys.platform))
+    return PLATFORM
+
+
+def arch_normalized():
+    """Normalize arch into format expected in CIPD paths."""
+
+    if ARCH is None:
+        raise Exception('unrecognized arch: {}'.format(_machine()))
+    return ARCH
 
 
+@_cache_result
 def user_agent():
     """Generate a user-agent based on the project name and current hash."""
 
     try:
-        rev = subprocess.check_output(
-            ['git', '-C', SCRIPT_DIR, 'rev-parse', 'HEAD']).strip()
-    except subprocess.CalledProcessError:
-        rev = '???'
+        rev = os.environ['PW_CIPD_REV']
+    except KeyError:
+        try:
+            rev = subprocess.check_output(
+                ['git', '-C', SCRIPT_DIR, 'rev-parse', 'HEAD']).strip()
+        except subprocess.CalledProcessError:
+            rev = '???'
 
     if isinstance(rev, bytes):
         rev = rev.decode()
@@ -114,37 +177,153 @@ def actual_hash(path):
 
     hasher = hashlib.sha256()
     with open(path, 'rb') as ins:
-        hasher.update(ins.read())
+        for block in iter(lambda: ins.read(HASH_BLOCK_SIZE), b''):
+            hasher.update(block)
     return hasher.hexdigest()
 
 
-def expected_hash():
-    """Pulls expected hash from digests file."""
-
-    expected_plat = '{}-{}'.format(platform_normalized(), arch_normalized())
+@_cache_result
+def _sha256_digests():
+    """Parses the digests file into a dict of platform to SHA-256 digest."""
 
+    digests = {}
     with open(DIGESTS_FILE, 'r') as ins:
         for line in ins:
             line = line.strip()
             if line.startswith('#') or not line:
                 continue
-            plat, hashtype, hashval = line.split()
-            if (hashtype == 'sha256' and plat == expected_plat):
-                return hashval
-    raise Exception('platform {} not in {}'.format(expected_plat,
-                                                   DIGESTS_FILE))
+            plat, hashtype, hashval = line.split(None, 2)
+            if hashtype == 'sha256':
+                digests[plat] = hashval
+    return digests
 
 
-def client_bytes():
-    """Pull down the CIPD client and return it as a bytes object.
+@_cache_result
+def expected_hash():
+    """Pulls expected hash from digests file."""
 
-    Often CIPD_HOST returns a 302 FOUND with a pointer to
-    storage.googleapis.com, so this needs to handle redirects, but it
-    shouldn't require the initial response to be a redirect either.
+    expected_plat = '{}-{}'.format(platform_normalized(), arch_normalized())
+
+    try:
+        return _sha256_digests()[expected_plat]
+    except KeyError:
+        raise Exception('platform {} not in {}'.format(
+            expected_plat, DIGESTS_FILE))
+
+
+def _is_pinned_client(client):
+    """Returns True if client matches the digest pinned for this platform.
+
+    Returns False when the digests file has no entry for this platform, so
+    the client is updated by the server instead.
     """
 
-    with open(VERSION_FILE, 'r') as ins:
-        version = ins.read().strip()
+    plat = '{}-{}'.format(platform_normalized(), arch_normalized())
+    expected = _sha256_digests().get(plat)
+    return expected is not None and actual_hash(client) == expected
+
+
+class TruncatedDownload(Exception):
+    """The CIPD client download ended before Content-Length bytes arrived."""
+
+
+class _HashingWriter:  # pylint: disable=too-few-public-methods
+    """File-like wrapper that hashes everything written through it."""
+    def __init__(self, output):
+        self._output = output
+        self.hasher = hashlib.sha256()
+
+    def write(self, data):
+        self.hasher.update(data)
+        return self._output.write(data)
+
+
+class _CountingReader:  # pylint: disable=too-few-public-methods
+    """File-like wrapper that counts the bytes read through it."""
+    def __init__(self, ins):
+        self._ins = ins
+        self.bytes_read = 0
+
+    def read(self, size):
+        data = self._ins.read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+class _GzipReader:  # pylint: disable=too-few-public-methods
+    """File-like wrapper that decompresses a gzip-encoded response.
+
+    gzip.GzipFile can't be used since it needs to seek in Python 2.
+    """
+    def __init__(self, res):
+        self._res = res
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def read(self, size):
+        while True:
+            block = self._res.read(size)
+            if not block:
+                return self._decompressor.flush()
+            data = self._decompressor.decompress(block)
+            if data:
+                return data
+
+
+def _write_and_hash(res, output, content_encoding, content_length):
+    """Copy the body of res to output and return its SHA-256 digest.
+
+    Raises TruncatedDownload if the body is shorter than content_length, so
+    a cut-off download isn't reported as a digest mismatch.
+    """
+
+    counter = _CountingReader(res)
+    ins = _GzipReader(counter) if content_encoding == 'gzip' else counter
+    writer = _HashingWriter(output)
+    shutil.copyfileobj(ins, writer, HASH_BLOCK_SIZE)
+
+    if (content_length is not None
+            and counter.bytes_read != int(content_length)):
+        raise TruncatedDownload(
+            'expected {} bytes of CIPD client, got {}'.format(
+                content_length, counter.bytes_read))
+
+    return writer.hasher.hexdigest()
+
+
+def _download_client_urllib3(urllib3, url, output):
+    """Download the client with urllib3, which follows redirects itself.
+
+    HTTP/2 wouldn't save a handshake here: the redirect goes to a different
+    host, which needs its own connection either way.
+    """
+
+    pool = urllib3.PoolManager(maxsize=4)
+    # Decode gzip here rather than in urllib3 so the bytes on the wire can be
+    # checked against Content-Length. urllib3 2.x checks the length itself by
+    # default and raises ProtocolError instead, so turn that off.
+    res = pool.request('GET',
+                       url,
+                       headers=REQUEST_HEADERS,
+                       retries=urllib3.Retry(total=10, redirect=10),
+                       preload_content=False,
+                       decode_content=False,
+                       enforce_content_length=False)
+    try:
+        if res.status == httplib.OK:
+            return _write_and_hash(res, output,
+                                   res.headers.get('content-encoding'),
+                                   res.headers.get('content-length'))
+    except urllib3.exceptions.ProtocolError as err:
+        # The connection was dropped partway through the body.
+        raise TruncatedDownload(str(err))
+    finally:
+        res.release_conn()
+
+    raise Exception('failed to download client')
+
+
+def _download_client_httplib(path, output):
+    """Download the client with httplib, following redirects by hand."""
 
     try:
         conn = httplib.HTTPSConnection(CIPD_HOST)
@@ -161,43 +340,90 @@ brew uninstall python && brew install python
         print('=' * 70)
         raise
 
+    # Keep one connection per host so repeated redirects to the same host
+    # reuse its socket instead of doing another TLS handshake.
+    connections = {CIPD_HOST: conn}
+    try:
+        for _ in range(10):
+            conn.request('GET', path, headers=REQUEST_HEADERS)
+            res = conn.getresponse()
+
+            # Found client bytes.
+            if res.status == httplib.OK:
+                return _write_and_hash(res, output,
+                                       res.getheader('content-encoding'),
+                                       res.getheader('content-length'))
+
+            # Have to read the response before making a new request, so make
+            # sure we always read it.
+            res.read()
+
+            # Redirecting to another location.
+            if res.status == httplib.FOUND:
+                location = res.getheader('location')
+                url = urlparse.urlparse(location)
+                if url.netloc not in connections:
+                    connections[url.netloc] = httplib.HTTPSConnection(
+                        url.netloc)
+                conn = connections[url.netloc]
+                path = '{}?{}'.format(url.path, url.query)
+
+            # Some kind of error in this response.
+            else:
+                break
+    finally:
+        for connection in connections.values():
+            connection.close()
+
+    raise Exception('failed to download client')
+
+
+def download_client(output):
+    """Pull down the CIPD client, write it to output, and return its digest.
+
+    Often CIPD_HOST returns a 302 FOUND with a pointer to
+    storage.googleapis.com, so this needs to handle redirects, but it
+    shouldn't require the initial response to be a redirect either.
+
+    The client is hashed block by block as it is written, so the downloaded
+    file doesn't need to be read back to verify it.
+    """
+
+    with open(VERSION_FILE, 'r') as ins:
+        version = ins.read().strip()
+
     path = '/client?platform={platform}-{arch}&version={version}'.format(
         platform=platform_normalized(),
         arch=arch_normalized(),
         version=version)
 
-    for _ in range(10):
-        conn.request('GET', path)
-        res = conn.getresponse()
-        # Have to read the response before making a new request, so make sure
-        # we always read it.
-        content = res.read()
-
-        # Found client bytes.
-        if res.status == httplib.OK:  # pylint: disable=no-else-return
-            return content
-
-        # Redirecting to another location.
-        elif res.status == httplib.FOUND:
-            location = res.getheader('location')
-            url = urlparse.urlparse(location)
-            if url.netloc != conn.host:
-                conn = httplib.HTTPSConnection(url.netloc)
-            path = '{}?{}'.format(url.path, url.query)
-
-        # Some kind of error in this response.
-        else:
-            break
+    # urllib3 pools connections across the redirect to storage.googleapis.com,
+    # but it's not available in every Python used for first-time bootstrapping.
+    # It's imported here since only bootstrapping needs it and wrapper.py runs
+    # on every cipd invocation.
+    # pylint: disable=import-outside-toplevel
+    try:
+        import urllib3  # type: ignore
+    except ImportError:
+        return _download_client_httplib(path, output)
 
-    raise Exception('failed to download client')
+    return _download_client_urllib3(urllib3,
+                                    'https://{}{}'.format(CIPD_HOST, path),
+                                    output)
 
 
 def bootstrap(client, silent=('PW_ENVSETUP_QUIET' in os.environ)):
     """Bootstrap cipd client installation."""
 
+    # Equivalent to os.makedirs(exist_ok=True), which Python 2 lacks. Unlike
+    # checking first, this doesn't race with init_many() threads creating
+    # the same parent directories.
     client_dir = os.path.dirname(client)
-    if not os.path.isdir(client_dir):
+    try:
         os.makedirs(client_dir)
+    except OSError:
+        if not os.path.isdir(client_dir):
+            raise
 
     if not silent:
         print('Bootstrapping cipd client for {}-{}'.format(
@@ -205,17 +431,26 @@ def bootstrap(client, silent=('PW_ENVSETUP_QUIET' in os.environ)):
 
     tmp_path = client + '.tmp'
     with open(tmp_path, 'wb') as tmp:
-        tmp.write(client_bytes())
+        actual = download_client(tmp)
+        # Make sure the client is on disk before it's moved into place, so a
+        # crash can't leave behind a truncated client.
+        tmp.flush()
+        os.fsync(tmp.fileno())
 
     expected = expected_hash()
-    actual = actual_hash(tmp_path)
 
     if expected != actual:
         raise Exception('digest of downloaded CIPD client is incorrect, '
                         'check that digests file is current')
 
     os.chmod(tmp_path, 0o755)
-    os.rename(tmp_path, client)
+    try:
+        # Unlike os.rename(), this overwrites an existing client on Windows.
+        os.replace(tmp_path, client)
+    except AttributeError:  # Python 2.
+        if os.name == 'nt' and os.path.exists(client):
+            os.remove(client)
+        os.rename(tmp_path, client)
 
 
 def selfupdate(client):
@@ -227,29 +462,47 @@ def selfupdate(client):
         '-version-file', VERSION_FILE,
         '-service-url', 'https://{}'.format(CIPD_HOST),
     ]  # yapf: disable
-    subprocess.check_call(cmd)
+    # With close_fds=True, the child has to close every possible descriptor
+    # up to the fd limit before exec, which is slow on hosts with a high
+    # `ulimit -n`. Nothing sensitive is open here, so skip that and let Python
+    # use posix_spawn where it can.
+    subprocess.check_call(cmd, close_fds=False)
 
 
 def init(install_dir=DEFAULT_INSTALL_DIR, silent=False):
     """Install/update cipd client."""
 
-    os.environ['CIPD_HTTP_USER_AGENT_PREFIX'] = user_agent()
+    # Only assign when the value changes, so init_many()'s threads just read
+    # the value it already set.
+    if os.environ.get('CIPD_HTTP_USER_AGENT_PREFIX') != user_agent():
+        os.environ['CIPD_HTTP_USER_AGENT_PREFIX'] = user_agent()
 
     client = os.path.join(install_dir, 'cipd')
     if os.name == 'nt':
         client += '.exe'
 
     try:
+        # bootstrap() hashes the client as it downloads it, so a freshly
+        # bootstrapped client is already known to match the digests file.
         if not os.path.isfile(client):
-            bootstrap(client, silent)
-
-        try:
-            selfupdate(client)
-        except subprocess.CalledProcessError:
-            print('CIPD selfupdate failed. Bootstrapping then retrying...',
-                  file=sys.stderr)
-            bootstrap(client)
-            selfupdate(client)
+            try:
+                bootstrap(client, silent)
+            except TruncatedDownload:
+                print('CIPD client download was cut off. Retrying...',
+                      file=sys.stderr)
+                bootstrap(client, silent)
+
+        # The digests file pins the exact client binary, so if the installed
+        # client already matches there's no need to ask the server for an
+        # update.
+        elif not _is_pinned_client(client):
+            try:
+                selfupdate(client)
+            except subprocess.CalledProcessError:
+                print('CIPD selfupdate failed. Bootstrapping then retrying...',
+                      file=sys.stderr)
+                bootstrap(client)
+                selfupdate(client)
 
     except Exception:
         print('Failed to initialize CIPD. Run '
@@ -266,6 +519,35 @@ def init(install_dir=DEFAULT_INSTALL_DIR, silent=False):
     return client
 
 
+def init_many(install_dirs, silent=False):
+    """Install/update cipd clients in several directories concurrently.
+
+    Most of the time spent in init() is waiting on the network, so the
+    directories are handled in a thread pool. The directories must be
+    distinct. Returns the client paths in the same order as install_dirs.
+    """
+
+    install_dirs = list(install_dirs)
+    if not install_dirs:
+        return []
+
+    # Set this once up front; init() leaves it alone when it already matches,
+    # so the threads don't race on writing it.
+    os.environ['CIPD_HTTP_USER_AGENT_PREFIX'] = user_agent()
+
+    # Imported here since nothing else needs it and wrapper.py runs on every
+    # cipd invocation. concurrent.futures isn't available in Python 2.
+    import multiprocessing.pool  # pylint: disable=import-outside-toplevel
+
+    pool = multiprocessing.pool.ThreadPool(min(8, len(install_dirs)))
+    try:
+        return pool.map(lambda install_dir: init(install_dir, silent),
+                        install_dirs)
+    finally:
+        pool.close()
+        pool.join()
+
+
 if __name__ == '__main__':
     client_exe = init()
     subprocess.check_call([client_exe] + sys.argv[1:])
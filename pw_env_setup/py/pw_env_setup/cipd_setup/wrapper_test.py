@@ -0,0 +1,187 @@
+# Copyright 2020 The Pigweed Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+"""Tests for the CIPD client download code in cipd_setup.wrapper."""
+
+import gzip
+import hashlib
+import http.server
+import io
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from pw_env_setup.cipd_setup import wrapper
+
+try:
+    import urllib3  # type: ignore
+except ImportError:
+    urllib3 = None  # type: ignore  # pylint: disable=invalid-name
+
+# pylint: disable=protected-access
+
+_CLIENT = b'pretend this is the CIPD client binary\n' * 1000
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class WriteAndHashTest(unittest.TestCase):
+    """Tests for _write_and_hash."""
+    def test_plain_body(self):
+        outs = io.BytesIO()
+        digest = wrapper._write_and_hash(io.BytesIO(_CLIENT), outs, None,
+                                         str(len(_CLIENT)))
+        self.assertEqual(outs.getvalue(), _CLIENT)
+        self.assertEqual(digest, _sha256(_CLIENT))
+
+    def test_no_content_length(self):
+        outs = io.BytesIO()
+        digest = wrapper._write_and_hash(io.BytesIO(_CLIENT), outs, None,
+                                         None)
+        self.assertEqual(outs.getvalue(), _CLIENT)
+        self.assertEqual(digest, _sha256(_CLIENT))
+
+    def test_gzip_body_is_decompressed_and_hashed(self):
+        body = gzip.compress(_CLIENT)
+        outs = io.BytesIO()
+        digest = wrapper._write_and_hash(io.BytesIO(body), outs, 'gzip',
+                                         str(len(body)))
+        self.assertEqual(outs.getvalue(), _CLIENT)
+        self.assertEqual(digest, _sha256(_CLIENT))
+
+    def test_truncated_plain_body(self):
+        with self.assertRaises(wrapper.TruncatedDownload):
+            wrapper._write_and_hash(io.BytesIO(_CLIENT[:-10]), io.BytesIO(),
+                                    None, str(len(_CLIENT)))
+
+    def test_truncated_gzip_body(self):
+        body = gzip.compress(_CLIENT)
+        with self.assertRaises(wrapper.TruncatedDownload):
+            wrapper._write_and_hash(io.BytesIO(body[:len(body) // 2]),
+                                    io.BytesIO(), 'gzip', str(len(body)))
+
+
+class _ClientHandler(http.server.BaseHTTPRequestHandler):
+    """Serves _CLIENT, cut off after the number of bytes in the path."""
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(_CLIENT)))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(_CLIENT[:int(self.path.lstrip('/'))])
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@unittest.skipIf(urllib3 is None, 'urllib3 is not installed')
+class DownloadClientUrllib3Test(unittest.TestCase):
+    """Tests _download_client_urllib3 with a real urllib3 response."""
+    def setUp(self):
+        server = http.server.HTTPServer(('127.0.0.1', 0), _ClientHandler)
+        thread = threading.Thread(target=server.serve_forever, args=(0.01, ))
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        self._url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+
+    def _download(self, size: int, output: io.BytesIO) -> str:
+        return wrapper._download_client_urllib3(urllib3, self._url + str(size),
+                                                output)
+
+    def test_full_body(self):
+        output = io.BytesIO()
+        digest = self._download(len(_CLIENT), output)
+        self.assertEqual(output.getvalue(), _CLIENT)
+        self.assertEqual(digest, _sha256(_CLIENT))
+
+    def test_short_body_is_truncated_download(self):
+        with self.assertRaises(wrapper.TruncatedDownload):
+            self._download(100, io.BytesIO())
+
+
+@mock.patch.object(wrapper, 'bootstrap')
+class InitRetryTest(unittest.TestCase):
+    """Tests that init() retries a cut-off client download once."""
+    def setUp(self):
+        self._install_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._install_dir.cleanup)
+
+        # init() explains failures on stderr; keep that out of test output.
+        stderr = mock.patch('sys.stderr', new_callable=io.StringIO)
+        stderr.start()
+        self.addCleanup(stderr.stop)
+
+    def test_retries_truncated_download(self, mock_bootstrap):
+        mock_bootstrap.side_effect = [wrapper.TruncatedDownload('cut'), None]
+        wrapper.init(self._install_dir.name, silent=True)
+        self.assertEqual(mock_bootstrap.call_count, 2)
+
+    def test_gives_up_after_second_truncated_download(self, mock_bootstrap):
+        mock_bootstrap.side_effect = wrapper.TruncatedDownload('cut')
+        with self.assertRaises(wrapper.TruncatedDownload):
+            wrapper.init(self._install_dir.name, silent=True)
+        self.assertEqual(mock_bootstrap.call_count, 2)
+
+    def test_other_errors_are_not_retried(self, mock_bootstrap):
+        mock_bootstrap.side_effect = IOError('disk full')
+        with self.assertRaises(IOError):
+            wrapper.init(self._install_dir.name, silent=True)
+        self.assertEqual(mock_bootstrap.call_count, 1)
+
+
+
+@mock.patch.object(wrapper, 'selfupdate')
+class InitUpdateTest(unittest.TestCase):
+    """Tests that init() only updates a client that isn't pinned."""
+    def setUp(self):
+        install_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(install_dir.cleanup)
+
+        self._client = os.path.join(install_dir.name, 'cipd')
+        if os.name == 'nt':
+            self._client += '.exe'
+        with open(self._client, 'wb') as client:
+            client.write(_CLIENT)
+
+        self._install_dir = install_dir.name
+        self._plat = '{}-{}'.format(wrapper.platform_normalized(),
+                                    wrapper.arch_normalized())
+
+    def _init(self, digests):
+        with mock.patch.object(wrapper, '_sha256_digests',
+                               return_value=digests):
+            return wrapper.init(self._install_dir, silent=True)
+
+    def test_pinned_client_is_not_updated(self, mock_selfupdate):
+        self.assertEqual(self._init({self._plat: _sha256(_CLIENT)}),
+                         self._client)
+        mock_selfupdate.assert_not_called()
+
+    def test_outdated_client_is_updated(self, mock_selfupdate):
+        self._init({self._plat: _sha256(b'some other client')})
+        mock_selfupdate.assert_called_once_with(self._client)
+
+    def test_client_without_pinned_digest_is_updated(self, mock_selfupdate):
+        self._init({})
+        mock_selfupdate.assert_called_once_with(self._client)
+
+
+if __name__ == '__main__':
+    unittest.main()
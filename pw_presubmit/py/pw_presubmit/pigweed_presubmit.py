@@ -46,6 +46,9 @@ _LOG = logging.getLogger(__name__)
 #
 # Initialization
 #
+# These checks set up os.environ for the checks that follow, so they must run
+# alone when checks run concurrently.
+@filter_paths(always_run=True, exclusive=True)
 def init_cipd(ctx: PresubmitContext):
     # TODO(mohrr) invoke by importing rather than by subprocess.
     call(
@@ -65,6 +68,7 @@ def init_cipd(ctx: PresubmitContext):
     _LOG.debug('PATH %s', os.environ['PATH'])
 
 
+@filter_paths(always_run=True, exclusive=True)
 def init_virtualenv(ctx: PresubmitContext):
     """Set up virtualenv, assumes recent Python 3 is already installed."""
     virtualenv_source = ctx.repository_root.joinpath('pw_env_setup', 'py',
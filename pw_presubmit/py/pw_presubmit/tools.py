@@ -43,9 +43,13 @@ pragma_once function for an example.
 
 import argparse
 from collections import Counter, defaultdict
+from concurrent.futures import as_completed, ThreadPoolExecutor
 import contextlib
 import dataclasses
 import enum
+import functools
+import inspect
+import itertools
 import logging
 import re
 import os
@@ -53,10 +57,10 @@ from pathlib import Path
 import shlex
 import subprocess
 import sys
+import threading
 import time
 from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
-from typing import Sequence, Tuple, Union
-from inspect import signature
+from typing import Pattern, Sequence, Tuple, Union
 
 _LOG: logging.Logger = logging.getLogger(__name__)
 
@@ -71,13 +75,17 @@ def plural(items_or_count, singular: str, count_format='') -> str:
     except TypeError:
         count = items_or_count
 
-    num = f'{count:{count_format}}'
+    word = singular if count == 1 else _plural_form(singular)
+    return f'{format(count, count_format)} {word}'
 
+
+@functools.lru_cache(maxsize=64)
+def _plural_form(singular: str) -> str:
     if singular.endswith('y'):
-        return f'{num} {singular[:-1]}{"y" if count == 1 else "ies"}'
+        return f'{singular[:-1]}ies'
     if singular.endswith('s'):
-        return f'{num} {singular}{"" if count == 1 else "es"}'
-    return f'{num} {singular}{"" if count == 1 else "s"}'
+        return f'{singular}es'
+    return f'{singular}s'
 
 
 def git_stdout(*args: PathOrStr, repo: PathOrStr = '.') -> str:
@@ -86,11 +94,25 @@ def git_stdout(*args: PathOrStr, repo: PathOrStr = '.') -> str:
                           check=True).stdout.decode().strip()
 
 
+def _git_paths(*args: PathOrStr, repo: PathOrStr = '.') -> List[str]:
+    """Runs a git command with NUL-separated path output and splits it."""
+    stdout = subprocess.run(('git', '-C', repo, *args),
+                            stdout=subprocess.PIPE,
+                            check=True).stdout
+    return [os.fsdecode(path) for path in stdout.split(b'\0') if path]
+
+
+@functools.lru_cache(maxsize=None)
+def _cached_git_ls_files(repo: str, args: Tuple[str, ...]) -> Tuple[str, ...]:
+    return tuple(
+        os.path.normpath(os.path.join(repo, path))
+        for path in _git_paths('ls-files', '-z', '--', *args, repo=repo))
+
+
 def _git_ls_files(*args: PathOrStr, repo: PathOrStr = '.') -> List[str]:
-    return [
-        os.path.abspath(os.path.join(repo, path))
-        for path in git_stdout('ls-files', '--', *args, repo=repo).split()
-    ]
+    return list(
+        _cached_git_ls_files(os.path.abspath(repo),
+                             tuple(str(arg) for arg in args)))
 
 
 def git_diff_names(commit: str = 'HEAD',
@@ -99,14 +121,15 @@ def git_diff_names(commit: str = 'HEAD',
     """Returns absolute paths of files changed since the specified commit."""
     root = git_repo_path(repo=repo)
     return [
-        os.path.abspath(os.path.join(root, path))
-        for path in git_stdout('diff',
+        os.path.normpath(os.path.join(root, path))
+        for path in _git_paths('diff',
                                '--name-only',
+                               '-z',
                                '--diff-filter=d',
                                commit,
                                '--',
                                *paths,
-                               repo=repo).split()
+                               repo=repo)
     ]
 
 
@@ -119,27 +142,96 @@ def list_git_files(
     """Lists files with git ls-files or git diff --name-only.
 
     This function may only be called if repo is or is in a Git repository.
+
+    Git is used even without a commit, rather than walking the directory
+    tree, because only tracked files should be checked. A walk would also
+    pick up untracked files and would have to reimplement .gitignore rules.
     """
 
     if commit:
         files = git_diff_names(commit, paths, repo=repo)
     else:
         files = _git_ls_files(*paths, repo=repo)
+
+    combined_exclude = _combine_regexes(exclude)
     return sorted(
         set(
             Path(path) for path in files
-            if not any(exp.search(path) for exp in exclude)))
+            if not any(exp.search(path) for exp in combined_exclude)))
+
+
+# Matches the start of an inline flag group, such as (?i) or (?s:...).
+_INLINE_FLAGS = re.compile(r'\(\?[aiLmsux-]')
+
+
+def _combine_regexes(patterns: Iterable[Pattern[str]]) -> List[Pattern[str]]:
+    """Merges compiled regexes into one alternation per distinct set of flags.
+
+    Searching with the result matches the same strings as searching with each
+    of the original patterns, but usually with a single regex. Patterns with
+    groups or inline flags can change meaning or fail to compile when joined,
+    so if any are present, the patterns are returned unchanged.
+    """
+    patterns = list(patterns)
+    if len(patterns) <= 1 or any(
+            exp.groups or _INLINE_FLAGS.search(exp.pattern)
+            for exp in patterns):
+        return patterns
+
+    by_flags: Dict[int, List[str]] = defaultdict(list)
+    for exp in patterns:
+        by_flags[exp.flags].append(f'(?:{exp.pattern})')
+
+    try:
+        return [
+            re.compile('|'.join(expressions), flags)
+            for flags, expressions in by_flags.items()
+        ]
+    except re.error:
+        return patterns
+
+
+# Absolute paths mapped to the root of the Git repository that contains them.
+_GIT_ROOTS: Dict[str, Path] = {}
+
+
+def _git_root(repo: PathOrStr, stderr=None) -> Path:
+    """Returns the root of repo's Git repository, only running git once.
+
+    Raises subprocess.CalledProcessError if repo isn't in a Git repository.
+    git's error output goes to stderr, which may be subprocess.DEVNULL.
+    """
+    key = os.path.abspath(repo)
+
+    if key not in _GIT_ROOTS:
+        _GIT_ROOTS[key] = Path(
+            subprocess.run(('git', '-C', repo, 'rev-parse', '--show-toplevel'),
+                           stdout=subprocess.PIPE,
+                           stderr=stderr,
+                           check=True).stdout.decode().strip())
+
+    return _GIT_ROOTS[key]
+
+
+def _clear_git_caches() -> None:
+    """Forgets cached repository roots and git ls-files results."""
+    _GIT_ROOTS.clear()
+    _cached_git_ls_files.cache_clear()
 
 
 def is_git_repo(path='.') -> bool:
+    # A path with a known work tree root is in a repo. Otherwise, use a bare
+    # rev-parse, which also succeeds in bare repos and .git directories.
+    if os.path.abspath(path) in _GIT_ROOTS:
+        return True
+
     return not subprocess.run(['git', '-C', path, 'rev-parse'],
                               stderr=subprocess.DEVNULL).returncode
 
 
 def git_repo_path(*paths, repo: PathOrStr = '.') -> Path:
     """Returns a path relative to a Git repository's root."""
-    return Path(git_stdout('rev-parse', '--show-toplevel',
-                           repo=repo)).joinpath(*paths)
+    return _git_root(repo).joinpath(*paths)
 
 
 def _make_color(*codes: int):
@@ -180,9 +272,9 @@ _LEFT = 7
 _RIGHT = 11
 
 
-def _title(msg, style=_SUMMARY_BOX) -> str:
+def _title(msg, style=_SUMMARY_BOX, box=_make_box('^')) -> str:
     msg = f' {msg} '.center(WIDTH - 2)
-    return _make_box('^').format(*style, section1=msg, width1=len(msg))
+    return box.format(*style, section1=msg, width1=len(msg))
 
 
 def _format_time(time_s: float) -> str:
@@ -234,6 +326,14 @@ class PresubmitContext:
     paths: Sequence[Path]
 
 
+def _merge_counters(counters: Iterable[Counter]) -> Counter:
+    """Adds counters into a single accumulator, without copying for each."""
+    total: Counter = Counter()
+    for counter in counters:
+        total.update(counter)
+    return total
+
+
 def file_summary(paths: Iterable[Path],
                  levels: int = 2,
                  max_lines: int = 12,
@@ -247,7 +347,8 @@ def file_summary(paths: Iterable[Path],
     all_counts: Dict[Any, Counter] = defaultdict(Counter)
 
     for path in paths:
-        parent = path.parents[max(len(path.parents) - levels, 0)]
+        parents = path.parents
+        parent = parents[max(len(parents) - levels, 0)]
         all_counts[parent][path.suffix] += 1
 
     # If there are too many lines, condense directories with the fewest files.
@@ -256,16 +357,19 @@ def file_summary(paths: Iterable[Path],
                         key=lambda item: -sum(item[1].values()))
         counts, others = sorted(counts[:max_lines - 1]), counts[max_lines - 1:]
         counts.append((f'({plural(others, "other")})',
-                       sum((c for _, c in others), Counter())))
+                       _merge_counters(c for _, c in others)))
     else:
         counts = sorted(all_counts.items())
 
-    width = max(len(str(d)) + len(os.sep) for d, _ in counts) if counts else 0
+    # Convert each directory to a string once for measuring and output.
+    str_counts = [(str(d), files) for d, files in counts]
+
+    width = max(len(d) + len(os.sep) for d, _ in str_counts) if counts else 0
     width += len(pad_start)
 
     # Prepare the output.
     output = []
-    for path, files in counts:
+    for directory, files in str_counts:
         total = sum(files.values())
         del files['']  # Never display no-extension files individually.
 
@@ -279,12 +383,93 @@ def file_summary(paths: Iterable[Path],
         else:
             types = ''
 
-        root = f'{path}{os.sep}{pad_start}'.ljust(width, pad)
+        root = f'{directory}{os.sep}{pad_start}'.ljust(width, pad)
         output.append(f'{root}{pad_end}{plural(total, "file")}{types}')
 
     return output
 
 
+class _NameSanitizer(dict):
+    """str.translate table that replaces non-alphanumeric characters with _.
+
+    Entries are filled in on first use, so any Unicode character works.
+    """
+    def __missing__(self, code: int) -> str:
+        char = chr(code)
+        self[code] = replacement = char if char.isalnum() else '_'
+        return replacement
+
+
+_NAME_SANITIZER = _NameSanitizer()
+
+
+def _sanitize_name(name: str) -> str:
+    """Collapses runs of non-alphanumeric characters to _ and lowercases."""
+    sanitized = name.translate(_NAME_SANITIZER)
+    while '__' in sanitized:
+        sanitized = sanitized.replace('__', '_')
+    return sanitized.lower()
+
+
+class _ConsoleBuffer:
+    """Holds back console output from checks running in worker threads.
+
+    While active, log records that would go to the root logger's handlers and
+    lines passed to print() are stored per thread. When a check finishes, its
+    output is written as one block, so concurrent checks don't interleave.
+    """
+    def __init__(self):
+        self._buffers: Dict[int, List[Any]] = {}
+        self._write_lock = threading.Lock()
+        self._filters: List[Tuple[logging.Handler, Callable]] = []
+
+    def __enter__(self) -> '_ConsoleBuffer':
+        for handler in logging.getLogger().handlers:
+            hold = functools.partial(self._hold, handler)
+            handler.addFilter(hold)
+            self._filters.append((handler, hold))
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        for handler, hold in self._filters:
+            handler.removeFilter(hold)
+        self._filters.clear()
+
+    def _hold(self, handler: logging.Handler, record: logging.LogRecord):
+        # record.thread is None when logging.logThreads is off.
+        if record.thread is None:
+            return True
+
+        buffer = self._buffers.get(record.thread)
+        if buffer is None:
+            return True
+
+        buffer.append((handler, record))
+        return False
+
+    def print(self, line: str) -> None:
+        self._buffers[threading.get_ident()].append(line)
+
+    @contextlib.contextmanager
+    def capture(self):
+        """Buffers the current thread's output, then writes it all at once."""
+        buffer: List[Any] = []
+        self._buffers[threading.get_ident()] = buffer
+
+        try:
+            yield
+        finally:
+            del self._buffers[threading.get_ident()]
+
+            with self._write_lock:
+                for item in buffer:
+                    if isinstance(item, str):
+                        print(item, flush=True)
+                    else:
+                        handler, record = item
+                        handler.handle(record)
+
+
 class Presubmit:
     """Runs a series of presubmit checks on a list of files."""
     def __init__(self, repository_root: Path, output_directory: Path,
@@ -293,7 +478,10 @@ class Presubmit:
         self._output_directory = output_directory
         self._paths = paths
 
-    def run(self, full_program: Sequence, keep_going: bool = False) -> bool:
+    def run(self,
+            full_program: Sequence,
+            keep_going: bool = False,
+            parallel: bool = False) -> bool:
         """Executes a series of presubmit checks on the paths."""
 
         program = _apply_filters(full_program, self._paths)
@@ -315,7 +503,8 @@ class Presubmit:
         _LOG.debug('Checks:\n%s', '\n'.join(c.name for c, _ in program))
 
         start_time: float = time.time()
-        passed, failed, skipped = self._execute_checks(program, keep_going)
+        passed, failed, skipped = self._execute_checks(program, keep_going,
+                                                       parallel)
         self._log_summary(time.time() - start_time, passed, failed, skipped)
 
         return not failed and not skipped
@@ -345,11 +534,14 @@ class Presubmit:
                 _format_time(time_s)))
 
     @contextlib.contextmanager
-    def _context(self, name: str, paths: Sequence[Path]):
+    def _context(self,
+                 name: str,
+                 paths: Sequence[Path],
+                 current_thread_only: bool = False):
         # There are many characters banned from filenames on Windows. To
         # simplify things, just strip everything that's not a letter, digit,
         # or underscore.
-        sanitized_name = re.sub(r'[\W_]+', '_', name).lower()
+        sanitized_name = _sanitize_name(name)
         output_directory = self._output_directory.joinpath(sanitized_name)
         os.makedirs(output_directory, exist_ok=True)
 
@@ -357,6 +549,12 @@ class Presubmit:
                                       mode='w')
         handler.setLevel(logging.DEBUG)
 
+        # When checks run concurrently, keep other checks' messages out of
+        # this check's log.
+        if current_thread_only:
+            thread = threading.get_ident()
+            handler.addFilter(lambda record: record.thread == thread)
+
         try:
             _LOG.addHandler(handler)
 
@@ -369,26 +567,111 @@ class Presubmit:
         finally:
             _LOG.removeHandler(handler)
 
-    def _execute_checks(self, program,
-                        keep_going: bool) -> Tuple[int, int, int]:
+    def _execute_checks(self, program, keep_going: bool,
+                        parallel: bool) -> Tuple[int, int, int]:
         """Runs presubmit checks; returns (passed, failed, skipped) lists."""
+        numbered = [(i, check, paths)
+                    for i, (check, paths) in enumerate(program, 1)]
+
+        if not parallel:
+            passed, failed, _ = self._execute_sequentially(
+                numbered, len(program), keep_going)
+            return passed, failed, len(program) - passed - failed
+
+        # Exclusive checks are barriers: each runs alone, after the checks
+        # before it finish and before the checks after it start. This keeps
+        # setup checks, such as those that modify os.environ, in order. The
+        # other checks between barriers run concurrently.
         passed = failed = 0
 
-        for i, (check, paths) in enumerate(program, 1):
-            paths = [self._repository_root.joinpath(p) for p in paths]
-            with self._context(check.name, paths) as ctx:
-                result = check.run(ctx, i, len(program))
+        for exclusive, group in itertools.groupby(
+                numbered, key=lambda item: item[1].exclusive):
+            execute = (self._execute_sequentially
+                       if exclusive else self._execute_concurrently)
+            group_passed, group_failed, stop = execute(
+                list(group), len(program), keep_going)
+
+            passed += group_passed
+            failed += group_failed
+            if stop:
+                break
+
+        return passed, failed, len(program) - passed - failed
+
+    def _run_check(self,
+                   check: '_Check',
+                   paths: Sequence[Path],
+                   count: int,
+                   total: int,
+                   console: Optional[_ConsoleBuffer] = None) -> _Result:
+        paths = [self._repository_root.joinpath(p) for p in paths]
+        with self._context(check.name, paths, console is not None) as ctx:
+            if console is None:
+                return check.run(ctx, count, total)
+
+            with console.capture():
+                return check.run(ctx, count, total, console.print)
+
+    def _execute_sequentially(self, numbered_checks, total: int,
+                              keep_going: bool) -> Tuple[int, int, bool]:
+        """Runs checks in order; returns (passed, failed, stopped early)."""
+        passed = failed = 0
+
+        for i, check, paths in numbered_checks:
+            result = self._run_check(check, paths, i, total)
 
             if result is _Result.PASS:
                 passed += 1
             elif result is _Result.CANCEL:
-                break
+                return passed, failed, True
             else:
                 failed += 1
                 if not keep_going:
-                    break
-
-        return passed, failed, len(program) - passed - failed
+                    return passed, failed, True
+
+        return passed, failed, False
+
+    def _execute_concurrently(self, numbered_checks, total: int,
+                              keep_going: bool) -> Tuple[int, int, bool]:
+        """Runs checks in a thread pool; returns (passed, failed, stopped)."""
+        stop = False
+
+        with _ConsoleBuffer() as console, ThreadPoolExecutor(
+                max_workers=min(8, os.cpu_count() or 1)) as executor:
+            futures = [
+                executor.submit(self._run_check, check, paths, i, total,
+                                console)
+                for i, check, paths in numbered_checks
+            ]
+
+            try:
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        continue
+
+                    result = future.result()
+                    if result is _Result.CANCEL:
+                        stop = True
+                    elif result is not _Result.PASS:
+                        stop = stop or not keep_going
+
+                    # Checks that already started are allowed to finish.
+                    if stop:
+                        for pending in futures:
+                            pending.cancel()
+            except KeyboardInterrupt:
+                print()
+                for pending in futures:
+                    pending.cancel()
+                stop = True
+
+        # Count every check that ran, including those that finished after the
+        # checks were stopped.
+        results = [
+            future.result() for future in futures
+            if future.done() and not future.cancelled()
+        ]
+        return results.count(_Result.PASS), results.count(_Result.FAIL), stop
 
 
 def _apply_filters(
@@ -405,19 +688,73 @@ def _apply_filters(
     return [(c, check_to_paths[c]) for c in checks if c in check_to_paths]
 
 
+@functools.lru_cache(maxsize=None)
+def _compile_exclude(expressions: Tuple[str, ...]) -> Tuple[Pattern[str], ...]:
+    """Compiles exclude expressions, combining them into one regex if possible.
+
+    A path is excluded if any of the returned regexes fully matches it. Results
+    are cached since filters often share exclude expressions.
+    """
+    return tuple(_combine_regexes(re.compile(exp) for exp in expressions))
+
+
+def _is_extension(ending: str) -> bool:
+    """True for endings like '.py' that are exactly a path's last suffix."""
+    return (len(ending) > 1 and ending.rfind('.') == 0
+            and '/' not in ending and os.sep not in ending)
+
+
 def _map_checks_to_paths(
         filter_to_checks: Dict['_PathFilter', List['_Check']],
         paths: Sequence[Path]) -> Dict['_Check', Sequence[Path]]:
     checks_to_paths: Dict[_Check, Sequence[Path]] = {}
 
-    for filt, checks in filter_to_checks.items():
-        exclude = [re.compile(exp) for exp in filt.exclude]
+    filtered: Dict[_PathFilter, List[Path]] = {}
 
-        filtered_paths = tuple(
-            path for path in paths
-            if any(str(path).endswith(end)
-                   for end in filt.endswith) and not any(
-                       exp.fullmatch(str(path)) for exp in exclude))
+    # Index filters by extension so each path is only tested against filters
+    # that could match it. Filters with other endings (e.g. 'BUILD') are
+    # tested against every path. Every path ends with '', so filters that
+    # include it only need to check exclusions, if they have any.
+    by_extension: Dict[str, List[_PathFilter]] = defaultdict(list)
+    other_filters: List[_PathFilter] = []
+    exclude_only_filters: List[_PathFilter] = []
+
+    for filt in filter_to_checks:
+        if '' in filt.endswith:
+            if filt.exclude:
+                exclude_only_filters.append(filt)
+            else:
+                filtered[filt] = list(paths)
+                continue
+        elif all(_is_extension(end) for end in filt.endswith):
+            for end in set(filt.endswith):
+                by_extension[end].append(filt)
+        else:
+            other_filters.append(filt)
+
+        filtered[filt] = []
+
+    excludes = {
+        filt: _compile_exclude(filt.exclude)
+        for filt in filter_to_checks
+    }
+
+    for path in paths:
+        path_str = str(path)
+        dot = path_str.rfind('.')
+        candidates = [
+            *(by_extension.get(path_str[dot:], ()) if dot != -1 else ()),
+            *(filt for filt in other_filters
+              if path_str.endswith(filt.endswith)),
+            *exclude_only_filters,
+        ]
+
+        for filt in candidates:
+            if not any(exp.fullmatch(path_str) for exp in excludes[filt]):
+                filtered[filt].append(path)
+
+    for filt, checks in filter_to_checks.items():
+        filtered_paths = tuple(filtered[filt])
 
         for check in checks:
             if filtered_paths or check.always_run:
@@ -471,6 +808,12 @@ def add_arguments(parser: argparse.ArgumentParser) -> None:
                         '--keep-going',
                         action='store_true',
                         help='Continue instead of aborting when errors occur.')
+    parser.add_argument(
+        '-j',
+        '--parallel',
+        action='store_true',
+        help=('Run checks concurrently. Checks marked exclusive run alone, '
+              'after the checks before them finish.'))
 
 
 def run_presubmit(program: Sequence[Callable],
@@ -479,7 +822,8 @@ def run_presubmit(program: Sequence[Callable],
                   exclude: Sequence = (),
                   repository: PathOrStr = '.',
                   output_directory: Optional[PathOrStr] = None,
-                  keep_going: bool = False) -> bool:
+                  keep_going: bool = False,
+                  parallel: bool = False) -> bool:
     """Lists files in the current Git repo and runs a Presubmit with them.
 
     This changes the directory to the root of the Git repository after listing
@@ -493,17 +837,22 @@ def run_presubmit(program: Sequence[Callable],
         repository: git repository to check
         output_directory: where to place output files
         keep_going: whether to continue running checks if an error occurs
+        parallel: whether to run checks concurrently between exclusive checks
 
     Returns:
         True if all presubmit checks succeeded
     """
 
-    if not is_git_repo(repository):
+    # The repository may have changed since a previous run in this process.
+    _clear_git_caches()
+
+    try:
+        root = _git_root(repository, stderr=subprocess.DEVNULL)
+    except subprocess.CalledProcessError:
         _LOG.critical('Presubmit checks must be run from a Git repo')
         return False
 
     files = list_git_files(base, paths, exclude, repository)
-    root = git_repo_path(repo=repository)
 
     if not root.samefile(repository):
         _LOG.info('Checking files in the %s subdirectory of the %s repository',
@@ -519,7 +868,7 @@ def run_presubmit(program: Sequence[Callable],
         output_directory=Path(output_directory),
         paths=files,
     )
-    return presubmit.run(program, keep_going)
+    return presubmit.run(program, keep_going, parallel)
 
 
 def parse_args_and_run_presubmit(
@@ -570,10 +919,13 @@ class _Check:
     def __init__(self,
                  check_function: Callable[[PresubmitContext], None],
                  path_filter: _PathFilter = _PathFilter(),
-                 always_run: bool = True):
+                 always_run: bool = True,
+                 exclusive: bool = False):
         self._check: Callable = check_function
         self.filter: _PathFilter = path_filter
         self.always_run: bool = always_run
+        # When checks run concurrently, exclusive checks run alone, in order.
+        self.exclusive: bool = exclusive
 
         # Since _Check wraps a presubmit function, adopt that function's name.
         self.__name__ = self._check.__name__
@@ -582,10 +934,14 @@ class _Check:
     def name(self):
         return self.__name__
 
-    def run(self, ctx: PresubmitContext, count: int, total: int) -> _Result:
+    def run(self,
+            ctx: PresubmitContext,
+            count: int,
+            total: int,
+            output: Callable[[str], None] = print) -> _Result:
         """Runs the presubmit check on the provided paths."""
 
-        print(
+        output(
             _box(_CHECK_UPPER, f'{count}/{total}', self.name,
                  plural(ctx.paths, "file")))
 
@@ -597,7 +953,7 @@ class _Check:
         time_str = _format_time(time.time() - start_time_s)
         _LOG.debug('%s %s', self.name, result.value)
 
-        print(_box(_CHECK_LOWER, result.colorized(_LEFT), self.name, time_str))
+        output(_box(_CHECK_LOWER, result.colorized(_LEFT), self.name, time_str))
         _LOG.debug('%s duration:%s', self.name, time_str)
 
         return result
@@ -623,27 +979,47 @@ def _make_tuple(value: Iterable[str]) -> Tuple[str, ...]:
     return tuple([value] if isinstance(value, str) else value)
 
 
+def _count_parameters(function: Callable) -> int:
+    """Returns len(signature(function).parameters), avoiding it if possible."""
+
+    # For plain functions, the code object has the answer; signature() is
+    # only needed for methods, wrapped functions, and other callables.
+    if (inspect.isfunction(function) and not hasattr(function, '__wrapped__')
+            and not hasattr(function, '__signature__')):
+        code = function.__code__
+        if not code.co_flags & (inspect.CO_VARARGS | inspect.CO_VARKEYWORDS):
+            return code.co_argcount + code.co_kwonlyargcount
+
+    return len(inspect.signature(function).parameters)
+
+
 def filter_paths(endswith: Iterable[str] = (''),
                  exclude: Iterable[str] = (),
-                 always_run: bool = False):
+                 always_run: bool = False,
+                 exclusive: bool = False):
     """Decorator for filtering the paths list for a presubmit check function.
 
     Args:
         endswith: str or iterable of path endings to include
         exclude: regular expressions of paths to exclude
+        always_run: run the check even if no paths match the filters
+        exclusive: when checks run concurrently, run this check alone, after
+            the checks before it finish and before the checks after it start
 
     Returns:
         a wrapped version of the presubmit function
     """
     def filter_paths_for_function(function: Callable):
-        if len(signature(function).parameters) != 1:
+        parameters = _count_parameters(function)
+        if parameters != 1:
             raise TypeError('Functions wrapped with @filter_paths must take '
                             f'exactly one argument: {function.__name__} takes '
-                            f'{len(signature(function).parameters)}.')
+                            f'{parameters}.')
 
         return _Check(function,
                       _PathFilter(_make_tuple(endswith), _make_tuple(exclude)),
-                      always_run=always_run)
+                      always_run=always_run,
+                      exclusive=exclusive)
 
     return filter_paths_for_function
 
@@ -680,17 +1056,35 @@ def call(*args, **kwargs) -> None:
         raise PresubmitFailure
 
 
+def _has_pragma_once(path: Path) -> bool:
+    """Checks whether any line in the file starts with '#pragma once'."""
+
+    def found(contents: bytes) -> bool:
+        return (contents.startswith(b'#pragma once')
+                or b'\n#pragma once' in contents
+                or b'\r#pragma once' in contents)
+
+    # Search the raw bytes rather than iterating over decoded lines. The
+    # directive is almost always near the top, so try the first block before
+    # reading the rest of the file.
+    with open(path, 'rb') as file:
+        contents = file.read(4096)
+        return found(contents) or found(contents + file.read())
+
+
 @filter_paths(endswith='.h')
 def pragma_once(ctx: PresubmitContext) -> None:
     """Presubmit check that ensures all header files contain '#pragma once'."""
 
-    for path in ctx.paths:
-        _LOG.debug('Checking %s', path)
-        with open(path) as file:
-            for line in file:
-                if line.startswith('#pragma once'):
-                    break
-            else:
+    _LOG.debug('Checking %s', plural(ctx.paths, 'file'))
+
+    # Reading the headers is I/O bound, so check them in parallel. Cap the
+    # number of threads to avoid running out of file descriptors.
+    with ThreadPoolExecutor(
+            max_workers=min(32, (os.cpu_count() or 1) + 4)) as executor:
+        for path, has_pragma_once in zip(
+                ctx.paths, executor.map(_has_pragma_once, ctx.paths)):
+            if not has_pragma_once:
                 raise PresubmitFailure('#pragma once is missing!', path=path)
 
 
@@ -0,0 +1,348 @@
+# Copyright 2020 The Pigweed Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+"""Tests for the presubmit tools."""
+
+import io
+import logging
+import os
+from pathlib import Path
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from typing import List
+import unittest
+from unittest import mock
+
+from pw_presubmit import tools
+
+# pylint: disable=protected-access
+
+_FILES = [
+    'third_party/lib.cc',
+    'Third_Party/lib.h',
+    'src/aa.cc',
+    'src/bb.cc',
+    'src/ab.cc',
+]
+
+
+@mock.patch.object(tools, '_git_ls_files', return_value=_FILES)
+class ListGitFilesExcludeTest(unittest.TestCase):
+    """Tests list_git_files exclusions, which are combined when possible."""
+    def _list(self, *exclude: str):
+        return [
+            str(path) for path in tools.list_git_files(
+                exclude=[re.compile(exp) for exp in exclude])
+        ]
+
+    def test_no_exclusions(self, _):
+        self.assertEqual(self._list(), sorted(_FILES))
+
+    def test_plain_patterns_are_combined(self, _):
+        combined = tools._combine_regexes(
+            [re.compile('third_party'),
+             re.compile(r'\.h$')])
+        self.assertEqual(len(combined), 1)
+        self.assertEqual(self._list('third_party', r'\.h$'),
+                         ['src/aa.cc', 'src/ab.cc', 'src/bb.cc'])
+
+    def test_inline_flags(self, _):
+        self.assertEqual(self._list('(?i)third_party'),
+                         ['src/aa.cc', 'src/ab.cc', 'src/bb.cc'])
+        self.assertEqual(self._list('(?i)third_party', 'aa'),
+                         ['src/ab.cc', 'src/bb.cc'])
+
+    def test_duplicate_group_names(self, _):
+        self.assertEqual(self._list('(?P<dir>src)/a', '(?P<dir>src)/b'), [
+            'Third_Party/lib.h',
+            'third_party/lib.cc',
+        ])
+
+    def test_backreferences(self, _):
+        self.assertEqual(self._list(r'(a)\1', r'(b)\1'), [
+            'Third_Party/lib.h',
+            'src/ab.cc',
+            'third_party/lib.cc',
+        ])
+
+
+class CombineRegexesTest(unittest.TestCase):
+    """Tests when _combine_regexes joins patterns."""
+    def test_single_pattern_is_unchanged(self):
+        pattern = re.compile('abc')
+        self.assertEqual(tools._combine_regexes([pattern]), [pattern])
+
+    def test_patterns_with_groups_are_unchanged(self):
+        patterns = [re.compile('(a)'), re.compile('b')]
+        self.assertEqual(tools._combine_regexes(patterns), patterns)
+
+    def test_different_flags_are_combined_separately(self):
+        combined = tools._combine_regexes([
+            re.compile('a'),
+            re.compile('b'),
+            re.compile('c', re.IGNORECASE),
+        ])
+        self.assertEqual(len(combined), 2)
+        self.assertTrue(combined[1].search('C'))
+
+
+def _check(_):
+    pass
+
+
+class FilterPathsExcludeTest(unittest.TestCase):
+    """Tests @filter_paths exclusions, which are combined when possible."""
+    def _filter(self, *exclude: str):
+        check = tools.filter_paths(exclude=exclude)(_check)
+        ((_, paths), ) = tools._apply_filters([check],
+                                              [Path(p) for p in _FILES])
+        return sorted(str(path) for path in paths)
+
+    def test_plain_patterns(self):
+        self.assertEqual(self._filter(r'third_party/.*', r'.*\.h'),
+                         ['src/aa.cc', 'src/ab.cc', 'src/bb.cc'])
+
+    def test_inline_flags(self):
+        self.assertEqual(self._filter(r'(?i)third_party/.*'),
+                         ['src/aa.cc', 'src/ab.cc', 'src/bb.cc'])
+        self.assertEqual(self._filter(r'(?i)third_party/.*', r'src/aa\.cc'),
+                         ['src/ab.cc', 'src/bb.cc'])
+
+    def test_duplicate_group_names(self):
+        self.assertEqual(
+            self._filter(r'(?P<dir>src)/a.*', r'(?P<dir>src)/b.*'),
+            ['Third_Party/lib.h', 'third_party/lib.cc'])
+
+    def test_backreferences(self):
+        self.assertEqual(
+            self._filter(r'src/(a)\1.*', r'src/(b)\1.*'),
+            ['Third_Party/lib.h', 'src/ab.cc', 'third_party/lib.cc'])
+
+
+class GitRepoTest(unittest.TestCase):
+    """Tests is_git_repo and git_repo_path."""
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._temp.cleanup)
+        self.addCleanup(tools._clear_git_caches)
+        self._dir = Path(self._temp.name).resolve()
+
+    def _git(self, *args):
+        subprocess.run(['git', *args],
+                       cwd=self._dir,
+                       stdout=subprocess.DEVNULL,
+                       check=True)
+
+    def test_work_tree(self):
+        self._git('init', 'repo')
+        subdir = self._dir.joinpath('repo', 'subdir')
+        subdir.mkdir()
+
+        self.assertTrue(tools.is_git_repo(subdir))
+        self.assertEqual(tools.git_repo_path('a', repo=subdir),
+                         self._dir.joinpath('repo', 'a'))
+        self.assertTrue(tools.is_git_repo(subdir))
+
+    def test_bare_repo_and_git_directory(self):
+        self._git('init', '--bare', 'bare.git')
+        self._git('init', 'repo')
+
+        self.assertTrue(tools.is_git_repo(self._dir.joinpath('bare.git')))
+        self.assertTrue(tools.is_git_repo(self._dir.joinpath('repo', '.git')))
+
+    def test_not_a_repo(self):
+        # Ceiling directories keep git from finding a repo above the temp dir.
+        with mock.patch.dict(os.environ,
+                             {'GIT_CEILING_DIRECTORIES': str(self._dir)}):
+            self.assertFalse(tools.is_git_repo(self._dir))
+
+            with self.assertRaises(subprocess.CalledProcessError):
+                tools.git_repo_path(repo=self._dir)
+
+    def test_run_presubmit_outside_repo_hides_git_errors(self):
+        # git writes errors to file descriptor 2 directly, so capture that.
+        stderr_fd = os.dup(2)
+        self.addCleanup(os.close, stderr_fd)
+
+        with tempfile.TemporaryFile() as stderr, mock.patch.dict(
+                os.environ, {'GIT_CEILING_DIRECTORIES': str(self._dir)}):
+            os.dup2(stderr.fileno(), 2)
+            try:
+                with self.assertLogs(tools._LOG, logging.CRITICAL):
+                    self.assertFalse(
+                        tools.run_presubmit([], repository=self._dir))
+            finally:
+                os.dup2(stderr_fd, 2)
+
+            stderr.seek(0)
+            self.assertEqual(stderr.read(), b'')
+
+
+def _make_check(name: str, function, exclusive: bool = False):
+    function.__name__ = name
+    return tools._Check(function, exclusive=exclusive)
+
+
+class ParallelPresubmitTest(unittest.TestCase):
+    """Tests running presubmit checks concurrently."""
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self._output_directory = Path(temp.name)
+        self._presubmit = tools.Presubmit(Path(temp.name), Path(temp.name), [])
+
+        cpu_count = mock.patch('os.cpu_count', return_value=2)
+        cpu_count.start()
+        self.addCleanup(cpu_count.stop)
+
+        # Send printed lines and console logs to the same place.
+        stdout = mock.patch('sys.stdout', new_callable=io.StringIO)
+        self._console = stdout.start()
+        self.addCleanup(stdout.stop)
+
+        handler = logging.StreamHandler(self._console)
+        logging.getLogger().addHandler(handler)
+        self.addCleanup(logging.getLogger().removeHandler, handler)
+
+        self._lock = threading.Lock()
+        self._events: List[str] = []
+
+    def _event(self, event: str) -> None:
+        with self._lock:
+            self._events.append(event)
+
+    def _sleeper(self, name: str, fail: bool = False, exclusive=False):
+        def check(_):
+            self._event(name)
+            time.sleep(0.2)
+            if fail:
+                raise tools.PresubmitFailure
+
+        return _make_check(name, check, exclusive)
+
+    def _execute(self, checks, keep_going: bool = False):
+        return self._presubmit._execute_checks([(c, ()) for c in checks],
+                                               keep_going,
+                                               parallel=True)
+
+    def test_exclusive_checks_are_barriers(self):
+        both_running = threading.Barrier(2, timeout=5)
+
+        def setup(_):
+            time.sleep(0.1)
+            self._event('setup')
+
+        def concurrent(_):
+            both_running.wait()
+            self._event('concurrent')
+
+        def last(_):
+            self._event('last')
+
+        checks = [
+            _make_check('setup', setup, exclusive=True),
+            _make_check('a', concurrent),
+            _make_check('b', concurrent),
+            _make_check('barrier', setup, exclusive=True),
+            _make_check('last', last),
+        ]
+        self.assertEqual(self._execute(checks), (5, 0, 0))
+        self.assertEqual(
+            self._events,
+            ['setup', 'concurrent', 'concurrent', 'setup', 'last'])
+
+    def test_failure_cancels_pending_checks(self):
+        checks = [self._sleeper('fail', fail=True)]
+        checks += [self._sleeper(f'check_{i}') for i in range(5)]
+
+        passed, failed, skipped = self._execute(checks)
+
+        self.assertEqual(failed, 1)
+        self.assertEqual(passed, len(self._events) - 1)
+        self.assertGreaterEqual(skipped, 2)
+        self.assertEqual(passed + failed + skipped, len(checks))
+
+    def test_keep_going_runs_every_check(self):
+        checks = [self._sleeper('fail', fail=True)]
+        checks += [self._sleeper(f'check_{i}') for i in range(3)]
+
+        self.assertEqual(self._execute(checks, keep_going=True), (3, 1, 0))
+
+    def test_failure_skips_checks_after_exclusive_check(self):
+        checks = [
+            self._sleeper('fail', fail=True, exclusive=True),
+            self._sleeper('a'),
+            self._sleeper('b'),
+        ]
+        self.assertEqual(self._execute(checks), (0, 1, 2))
+        self.assertEqual(self._events, ['fail'])
+
+    @mock.patch.object(tools, 'as_completed', side_effect=KeyboardInterrupt)
+    def test_ctrl_c_cancels_pending_checks(self, _):
+        checks = [self._sleeper(f'check_{i}') for i in range(4)]
+
+        passed, failed, skipped = self._execute(checks)
+
+        # Checks that were already running finish and are counted.
+        self.assertEqual(passed, len(self._events))
+        self.assertEqual(failed, 0)
+        self.assertGreaterEqual(skipped, 2)
+        self.assertEqual(passed + skipped, len(checks))
+
+    def test_step_log_only_has_its_own_check(self):
+        both_running = threading.Barrier(2, timeout=5)
+
+        def check(ctx):
+            both_running.wait()
+            tools._LOG.warning('message from %s', ctx.output_directory.name)
+            both_running.wait()
+
+        self.assertEqual(
+            self._execute([_make_check('a', check),
+                           _make_check('b', check)]), (2, 0, 0))
+
+        for name, other in (('a', 'b'), ('b', 'a')):
+            log = self._output_directory.joinpath(name,
+                                                  'step.log').read_text()
+            self.assertIn(f'message from {name}', log)
+            self.assertNotIn(f'message from {other}', log)
+
+    def test_console_output_is_not_interleaved(self):
+        both_running = threading.Barrier(2, timeout=5)
+
+        def check(ctx):
+            name = ctx.output_directory.name
+            both_running.wait()
+            tools._LOG.warning('first message from %s', name)
+            both_running.wait()
+            tools._LOG.warning('second message from %s', name)
+
+        self.assertEqual(
+            self._execute(
+                [_make_check('check_a', check),
+                 _make_check('check_b', check)]), (2, 0, 0))
+
+        # Each check's box titles and messages must not overlap the other's.
+        lines = self._console.getvalue().splitlines()
+        a_lines, b_lines = ([i for i, line in enumerate(lines) if name in line]
+                            for name in ('check_a', 'check_b'))
+        self.assertEqual(len(a_lines), 4)
+        self.assertEqual(len(b_lines), 4)
+        self.assertTrue(a_lines[-1] < b_lines[0] or b_lines[-1] < a_lines[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,14 +19,16 @@ maintaining token databases.
 """
 
 import argparse
+import contextlib
 from datetime import datetime
 import glob
 import logging
+import mmap
 import os
 import re
 import struct
 import sys
-from typing import Dict, Iterable
+from typing import Callable, Dict, Iterable, List
 
 try:
     from pw_tokenizer import elf_reader, tokens
@@ -39,6 +41,31 @@ except ImportError:
 
 _LOG = logging.getLogger('pw_tokenizer')
 
+_TOKENIZED_SECTIONS = re.compile(r'\.tokenized(\.\d+)?')
+_TOKENIZER_METADATA_SECTION = re.compile(r'\.tokenized\.meta')
+
+# Each metadata entry is a 12-byte null-padded key followed by a 32-bit value.
+_METADATA_ENTRY = '12sI'
+
+
+@contextlib.contextmanager
+def _mapped(fd):
+    """Memory-maps a file for reading; yields the file itself if that fails."""
+    # Yield outside of the except block, so errors raised by the caller aren't
+    # chained to the mmap failure.
+    try:
+        mapped = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        failed = False
+    except (OSError, ValueError):  # e.g. empty files or pipes
+        failed = True
+
+    if failed:
+        yield fd
+        return
+
+    with mapped:
+        yield mapped
+
 
 def _elf_reader(elf) -> elf_reader.Elf:
     return elf if isinstance(elf, elf_reader.Elf) else elf_reader.Elf(elf)
@@ -46,19 +73,34 @@ def _elf_reader(elf) -> elf_reader.Elf:
 
 def _read_strings_from_elf(elf) -> Iterable[str]:
     """Reads the tokenized strings from an elf_reader.Elf or ELF file object."""
-    sections = _elf_reader(elf).dump_sections(r'\.tokenized(\.\d+)?')
-    if sections is not None:
-        for string in sections.split(b'\0'):
-            yield string.decode()
+    sections = _elf_reader(elf).dump_sections(_TOKENIZED_SECTIONS)
+    if sections is None:
+        return
+
+    # Decode the whole section at once and split it, which is much faster than
+    # decoding each string separately. If the section is not valid UTF-8,
+    # decode the strings one at a time so the error reports the bad string.
+    strings: Iterable[str]
+    try:
+        strings = sections.decode().split('\0')
+    except UnicodeDecodeError:
+        strings = (string.decode() for string in sections.split(b'\0'))
+
+    yield from strings
 
 
 def read_tokenizer_metadata(elf) -> Dict[str, int]:
     """Reads the metadata entries from an ELF."""
-    sections = _elf_reader(elf).dump_sections(r'\.tokenized\.meta')
+    sections = _elf_reader(elf).dump_sections(_TOKENIZER_METADATA_SECTION)
 
     metadata: Dict[str, int] = {}
     if sections is not None:
-        for key, value in struct.iter_unpack('12sI', sections):
+        # Unpack every entry with a single call, then pair up keys and values.
+        # This measured faster than slicing keys out of a memoryview and
+        # reading the values through a strided memoryview.cast('I').
+        count = len(sections) // struct.calcsize(_METADATA_ENTRY)
+        fields = iter(struct.unpack(_METADATA_ENTRY * count, sections))
+        for key, value in zip(fields, fields):
             try:
                 metadata[key.rstrip(b'\0').decode()] = value
             except UnicodeDecodeError as err:
@@ -85,10 +127,14 @@ def _load_token_database(db) -> tokens.Database:
             raise FileNotFoundError(
                 '"{}" is not a path to a token database'.format(db))
 
-        # Read the path as an ELF file.
+        # Read the path as an ELF file. Check the magic number with a buffered
+        # read first so that CSV and binary databases are never mapped. Mapping
+        # the file lets the ELF reader touch only the pages it needs.
         with open(db, 'rb') as fd:
             if elf_reader.compatible_file(fd):
-                return tokens.Database.from_strings(_read_strings_from_elf(fd))
+                with _mapped(fd) as elf:
+                    return tokens.Database.from_strings(
+                        _read_strings_from_elf(elf))
 
         # Read the path as a packed binary or CSV file.
         return tokens.DatabaseFile(db)
@@ -105,23 +151,41 @@ def _load_token_database(db) -> tokens.Database:
     return tokens.Database(tokens.parse_csv(db))
 
 
+def _load_concurrently(load: Callable, sources: Iterable) -> List:
+    """Calls load on each source in a thread pool; results keep their order."""
+    sources = list(sources)
+    if len(sources) <= 1:
+        return [load(source) for source in sources]
+
+    # Import here, since concurrent.futures is only needed for multiple sources
+    # and is comparatively slow to import.
+    from concurrent import futures  # pylint: disable=import-outside-toplevel
+
+    # Loading is mostly file I/O, so overlap it across threads.
+    with futures.ThreadPoolExecutor() as executor:
+        return list(executor.map(load, sources))
+
+
 def load_token_database(*databases) -> tokens.Database:
     """Loads a Database from database objects, ELFs, CSVs, or binary files."""
-    return tokens.Database.merged(*(_load_token_database(db)
-                                    for db in databases))
+    return tokens.Database.merged(
+        *_load_concurrently(_load_token_database, databases))
 
 
 def generate_report(db: tokens.Database) -> Dict[str, int]:
     """Returns a simple report of properties of the database."""
-    present = [entry for entry in db.entries() if not entry.date_removed]
+    # Gather the strings into flat lists so the sizes can be summed with
+    # sum(map(len, ...)), which runs in C, instead of a Python-level loop.
+    entries = db.entries()
+    total = [entry.string for entry in entries]
+    present = [entry.string for entry in entries if not entry.date_removed]
 
     # Add 1 to each string's size to account for the null terminator.
     return {
         'present_entries': len(present),
-        'present_size_bytes': sum(len(entry.string) + 1 for entry in present),
-        'total_entries': len(db.entries()),
-        'total_size_bytes':
-        sum(len(entry.string) + 1 for entry in db.entries()),
+        'present_size_bytes': sum(map(len, present)) + len(present),
+        'total_entries': len(total),
+        'total_size_bytes': sum(map(len, total)) + len(total),
         'collisions': len(db.collisions()),
     }
 
@@ -133,12 +197,15 @@ def _handle_create(elf_or_token_database, database, force, output_type,
     if database == '-':
         # Must write bytes to stdout; use sys.stdout.buffer.
         fd = sys.stdout.buffer
-    elif not force and os.path.exists(database):
-        raise FileExistsError(
-            'The file {} already exists! Use --force to overwrite.'.format(
-                database))
     else:
-        fd = open(database, 'wb')
+        # Without --force, open in exclusive creation mode so that checking for
+        # an existing file and creating it happen in one step.
+        try:
+            fd = open(database, 'wb' if force else 'xb')
+        except FileExistsError as err:
+            raise FileExistsError(
+                'The file {} already exists! Use --force to overwrite.'.format(
+                    database)) from err
 
     database = tokens.Database.merged(*elf_or_token_database)
     database.filter(include, exclude)
@@ -158,8 +225,8 @@ def _handle_create(elf_or_token_database, database, force, output_type,
 def _handle_add(token_database, elf_or_token_database):
     initial = len(token_database)
 
-    for source in elf_or_token_database:
-        token_database.add((entry.string for entry in source.entries()))
+    token_database.add(entry.string for source in elf_or_token_database
+                       for entry in source.entries())
 
     token_database.write_to_file()
 
@@ -168,10 +235,14 @@ def _handle_add(token_database, elf_or_token_database):
 
 
 def _handle_mark_removals(token_database, elf_or_token_database, date):
-    marked_removed = token_database.mark_removals(
-        (entry.string
-         for entry in tokens.Database.merged(*elf_or_token_database).entries()
-         if not entry.date_removed), date)
+    # A string is present if any source has it without a removal date. Collect
+    # these directly rather than merging the sources into a Database first.
+    # mark_removals reuses a frozenset as is instead of copying it.
+    present = frozenset(entry.string for source in elf_or_token_database
+                        for entry in source.entries()
+                        if not entry.date_removed)
+
+    marked_removed = token_database.mark_removals(present, date)
 
     token_database.write_to_file()
 
@@ -204,13 +275,15 @@ def expand_paths_or_globs(paths_or_globs: Iterable[str]) -> Iterable[str]:
             # This is a valid path; yield it without evaluating it as a glob.
             yield path_or_glob
         else:
-            paths = glob.glob(path_or_glob)
-            if not paths:
+            # Iterate over matches lazily rather than building a list first.
+            paths = glob.iglob(path_or_glob)
+            first = next(paths, None)
+            if first is None:
                 raise FileNotFoundError(
                     '{} is not a valid path'.format(path_or_glob))
 
-            for path in paths:
-                yield path
+            yield first
+            yield from paths
 
 
 class LoadTokenDatabase(argparse.Action):
@@ -236,7 +309,7 @@ class LoadTokenDatabase(argparse.Action):
     def __call__(self, parser, namespace, values, option_string=None):
         setattr(
             namespace, self.dest,
-            [self._load_db(path) for path in expand_paths_or_globs(values)])
+            _load_concurrently(self._load_db, expand_paths_or_globs(values)))
 
 
 def _parse_args():
@@ -245,7 +318,7 @@ def _parse_args():
         if value == 'today':
             return datetime.now()
 
-        return datetime.strptime(value, tokens.DATE_FORMAT)
+        return tokens.parse_date(value)
 
     year_month_day.__name__ = 'year-month-day (YYYY-MM-DD)'
 
@@ -16,8 +16,10 @@
 import collections
 import csv
 from datetime import datetime
+import functools
 import io
 import logging
+import operator
 import re
 import struct
 from typing import BinaryIO, Callable, Dict, Iterable, List, NamedTuple
@@ -30,22 +32,37 @@ TOKENIZER_HASH_CONSTANT = 65599
 
 _LOG = logging.getLogger('pw_tokenizer')
 
+# Approximate number of characters write_csv formats before each write.
+_CSV_BATCH_SIZE = 64 * 1024
+
 
 def _value(char: Union[int, str]) -> int:
     return char if isinstance(char, int) else ord(char)
 
 
-def pw_tokenizer_65599_fixed_length_hash(string: Union[str, bytes],
-                                         hash_length: int) -> int:
-    """Hashes the provided string."""
-    hash_value = len(string)
+@functools.lru_cache()
+def _hash_coefficients(hash_length: int) -> Tuple[int, ...]:
+    """Returns the coefficient used for each character position."""
+    coefficients = []
     coefficient = TOKENIZER_HASH_CONSTANT
 
-    for char in string[:hash_length]:
-        hash_value = (hash_value + coefficient * _value(char)) % 2**32
+    for _ in range(hash_length):
+        coefficients.append(coefficient)
         coefficient = (coefficient * TOKENIZER_HASH_CONSTANT) % 2**32
 
-    return hash_value
+    return tuple(coefficients)
+
+
+def pw_tokenizer_65599_fixed_length_hash(string: Union[str, bytes],
+                                         hash_length: int) -> int:
+    """Hashes the provided string."""
+    chars = string[:hash_length]
+    values = map(ord, chars) if isinstance(chars, str) else map(_value, chars)
+
+    # Reducing modulo 2**32 once at the end gives the same result as reducing
+    # after each addition, and lets the sum of products run in C.
+    return (len(string) + sum(
+        map(operator.mul, _hash_coefficients(hash_length), values))) % 2**32
 
 
 def default_hash(string: Union[str, bytes]) -> int:
@@ -121,6 +138,11 @@ class Database:
     @classmethod
     def merged(cls, *databases: 'Database') -> 'Database':
         """Creates a TokenDatabase from one or more other databases."""
+        # A single database has no duplicate keys to reconcile, so build the
+        # new database from its entries directly instead of merging.
+        if len(databases) == 1:
+            return cls(databases[0].entries())
+
         db = cls()
         db.merge(*databases)
         return db
@@ -225,13 +247,11 @@ class Database:
         self._cache = None
 
         for other_db in databases:
+            # Insert or look up each entry with a single dict operation.
             for entry in other_db.entries():
-                key = entry.key()
-
-                if key in self._database:
-                    self._database[key].update_date_removed(entry.date_removed)
-                else:
-                    self._database[key] = entry
+                existing = self._database.setdefault(entry.key(), entry)
+                if existing is not entry:
+                    existing.update_date_removed(entry.date_removed)
 
     def filter(self, include: Iterable = (), exclude: Iterable = ()) -> None:
         """Filters the database using regular expressions (strings or compiled).
@@ -270,6 +290,19 @@ class Database:
         return csv_output.getvalue().decode()
 
 
+def parse_date(date_str: str) -> datetime:
+    """Parses a date in DATE_FORMAT (YYYY-MM-DD)."""
+    # datetime.fromisoformat is much faster than strptime, but it also accepts
+    # other ISO 8601 forms, so only use it for strings shaped like YYYY-MM-DD.
+    if len(date_str) == 10 and date_str[4] == date_str[7] == '-':
+        try:
+            return datetime.fromisoformat(date_str)
+        except ValueError:
+            pass
+
+    return datetime.strptime(date_str, DATE_FORMAT)
+
+
 def parse_csv(fd) -> Iterable[TokenizedStringEntry]:
     """Parses TokenizedStringEntries from a CSV token database file."""
     for line in csv.reader(fd):
@@ -277,8 +310,7 @@ def parse_csv(fd) -> Iterable[TokenizedStringEntry]:
             token_str, date_str, string_literal = line
 
             token = int(token_str, 16)
-            date = (datetime.strptime(date_str, DATE_FORMAT)
-                    if date_str.strip() else None)
+            date = parse_date(date_str) if date_str.strip() else None
 
             yield TokenizedStringEntry(token, string_literal, date)
         except (ValueError, UnicodeDecodeError) as err:
@@ -288,13 +320,29 @@ def parse_csv(fd) -> Iterable[TokenizedStringEntry]:
 
 def write_csv(database: Database, fd: BinaryIO) -> None:
     """Writes the database as CSV to the provided binary file."""
+    # Write rows in batches of about _CSV_BATCH_SIZE characters. This avoids a
+    # separate small write per row without holding the whole file in memory.
+    batch: List[str] = []
+    batch_size = 0
+
     for entry in sorted(database.entries()):
         # Align the CSV output to 10-character columns for improved readability.
         # Use \n instead of RFC 4180's \r\n.
-        fd.write('{:08x},{:10},"{}"\n'.format(
+        row = '{:08x},{:10},"{}"\n'.format(
             entry.token,
             entry.date_removed.strftime(DATE_FORMAT) if entry.date_removed else
-            '', entry.string.replace('"', '""')).encode())  # escape " as ""
+            '', entry.string.replace('"', '""'))  # escape " as ""
+
+        batch.append(row)
+        batch_size += len(row)
+
+        if batch_size >= _CSV_BATCH_SIZE:
+            fd.write(''.join(batch).encode())
+            batch.clear()
+            batch_size = 0
+
+    if batch:
+        fd.write(''.join(batch).encode())
 
 
 class _BinaryFileFormat(NamedTuple):
@@ -362,6 +410,8 @@ def write_binary(database: Database, fd: BinaryIO) -> None:
 
     fd.write(BINARY_FORMAT.header.pack(BINARY_FORMAT.magic, len(entries)))
 
+    # Pack the entries into one buffer so they are written with a single call.
+    entry_table = bytearray()
     string_table = bytearray()
 
     for entry in entries:
@@ -380,10 +430,10 @@ def write_binary(database: Database, fd: BinaryIO) -> None:
         string_table += entry.string.encode()
         string_table.append(0)
 
-        fd.write(
-            BINARY_FORMAT.entry.pack(entry.token, removed_day, removed_month,
-                                     removed_year))
+        entry_table += BINARY_FORMAT.entry.pack(entry.token, removed_day,
+                                                removed_month, removed_year)
 
+    fd.write(entry_table)
     fd.write(string_table)
 
 
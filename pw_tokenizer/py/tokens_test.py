@@ -18,6 +18,7 @@ import datetime
 import io
 import logging
 import unittest
+from unittest import mock
 
 from pw_tokenizer import tokens
 from pw_tokenizer.tokens import _LOG
@@ -113,6 +114,23 @@ class TokenDatabaseTest(unittest.TestCase):
         self.assertEqual(str(db), ('00000000,1990-02-01,"Commas,"",,"\n'
                                    '00000001,1990-01-01,"Quotes"""\n'))
 
+    def test_csv_written_in_batches(self):
+        db = read_db_from_csv(CSV_DATABASE)
+        writes = []
+
+        class RecordingFile(io.BytesIO):
+            def write(self, data):
+                writes.append(data)
+                return super().write(data)
+
+        with mock.patch.object(tokens, '_CSV_BATCH_SIZE', 100):
+            output = RecordingFile()
+            tokens.write_csv(db, output)
+
+        self.assertEqual(output.getvalue().decode(), CSV_DATABASE)
+        self.assertGreater(len(writes), 1)
+        self.assertLess(len(writes), len(db))
+
     def test_bad_csv(self):
         with self.assertLogs(_LOG, logging.ERROR) as logs:
             db = read_db_from_csv(INVALID_CSV)
@@ -423,5 +441,46 @@ class TestFilter(unittest.TestCase):
             })
 
 
+class TestParseDate(unittest.TestCase):
+    """Tests parsing removal dates."""
+    def test_year_month_day(self):
+        self.assertEqual(tokens.parse_date('2019-06-10'),
+                         datetime.datetime(2019, 6, 10))
+
+    def test_leap_day(self):
+        self.assertEqual(tokens.parse_date('2020-02-29'),
+                         datetime.datetime(2020, 2, 29))
+
+    def test_unpadded_fields_fall_back_to_strptime(self):
+        self.assertEqual(tokens.parse_date('2020-1-1'),
+                         datetime.datetime(2020, 1, 1))
+        self.assertEqual(tokens.parse_date('2020-1-01'),
+                         datetime.datetime(2020, 1, 1))
+
+    def test_invalid_dates_are_rejected(self):
+        for date in ('2020-02-30', '2019-02-29', '2020-13-01', 'abcd-ef-gh',
+                     ''):
+            with self.assertRaises(ValueError, msg=date):
+                tokens.parse_date(date)
+
+    def test_other_iso_formats_are_rejected(self):
+        for date in ('2020-01-01T00', '2020-01-01 00:00', '20200101',
+                     '2020-W01-1', '2020-01-01 '):
+            with self.assertRaises(ValueError, msg=date):
+                tokens.parse_date(date)
+
+    def test_csv_removal_dates(self):
+        db = tokens.Database(tokens.parse_csv(io.StringIO(CSV_DATABASE)))
+        self.assertEqual(
+            {e.string: e.date_removed
+             for e in db.entries() if e.date_removed}, {
+                 '': datetime.datetime(2019, 6, 10),
+                 'Jello, world!': datetime.datetime(2019, 6, 11),
+                 'Jello!': datetime.datetime(2019, 6, 12),
+                 'Jello?': datetime.datetime(2020, 1, 1),
+                 "Won't fit : %s%d": datetime.datetime(2019, 6, 10),
+             })
+
+
 if __name__ == '__main__':
     unittest.main()